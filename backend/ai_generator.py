@@ -1,10 +1,24 @@
 import anthropic
 import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
 from enum import Enum, auto
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any, AsyncGenerator
+from typing import List, Optional, Dict, Any, AsyncGenerator, Deque, Tuple
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+# Offset to convert monotonic timestamps back to wall-clock time when formatting
+_WALL_CLOCK_OFFSET_NS = time.time_ns() - time.monotonic_ns()
+
+# Most recent tool calls kept per conversation; tool_call_count still tracks the total
+TOOL_CALL_HISTORY_SIZE = 256
+
 
 class ConversationState(Enum):
     """States in the conversation state machine"""
@@ -16,7 +30,7 @@ class ConversationState(Enum):
     ERROR = auto()
 
 
-@dataclass
+@dataclass(slots=True)
 class StateTransition:
     """Represents a state transition with metadata"""
     from_state: ConversationState
@@ -25,26 +39,41 @@ class StateTransition:
     data: Optional[Dict[str, Any]] = None
 
 
-@dataclass
+@dataclass(slots=True)
+class ToolCall:
+    """A single tracked tool call; the timestamp is only formatted when read"""
+    index: int
+    tool_name: str
+    input: Dict[str, Any]
+    result: str
+    timestamp_ns: int
+
+    @property
+    def timestamp(self) -> str:
+        """Wall-clock ISO timestamp of the call"""
+        return datetime.fromtimestamp((self.timestamp_ns + _WALL_CLOCK_OFFSET_NS) / 1e9).isoformat()
+
+
+@dataclass(slots=True)
 class ConversationContext:
     """Maintains rich context throughout state transitions"""
     messages: List[Dict[str, Any]]
-    system_prompt: str
+    system_prompt: List[Dict[str, Any]]
     tool_call_count: int = 0
-    tool_call_history: List[Dict] = field(default_factory=list)
+    tool_call_history: Deque[ToolCall] = field(default_factory=lambda: deque(maxlen=TOOL_CALL_HISTORY_SIZE))
     intermediate_responses: List[str] = field(default_factory=list)
     metadata: Dict[str, Any] = field(default_factory=dict)
 
     def add_tool_call(self, tool_name: str, tool_input: Dict, result: str):
         """Track each tool call with metadata"""
         self.tool_call_count += 1
-        self.tool_call_history.append({
-            "index": self.tool_call_count,
-            "tool_name": tool_name,
-            "input": tool_input,
-            "result": result,
-            "timestamp": datetime.now().isoformat()
-        })
+        self.tool_call_history.append(ToolCall(
+            index=self.tool_call_count,
+            tool_name=tool_name,
+            input=tool_input,
+            result=result,
+            timestamp_ns=time.monotonic_ns()
+        ))
 
 
 class AIGenerator:
@@ -79,8 +108,35 @@ All responses must be:
 4. **Example-supported** - Include relevant examples when they aid understanding
 Provide only the direct answer to what was asked.
 """
+
+    # Static system block marked for prompt caching so the prefix is only processed once server-side
+    _SYSTEM_BLOCK = {
+        "type": "text",
+        "text": SYSTEM_PROMPT,
+        "cache_control": {"type": "ephemeral"}
+    }
+
+    # System content for requests without history, shared as-is across calls
+    _SYSTEM_ONLY = [_SYSTEM_BLOCK]
+
+    # Shared tool_choice value for requests that offer tools
+    _TOOL_CHOICE_AUTO = {"type": "auto"}
+
+    # Maximum number of final responses kept in the in-memory LRU cache
+    RESPONSE_CACHE_SIZE = 1024
+
+    # Worker threads used to run calls to different tools from one turn concurrently
+    TOOL_WORKERS = 4
+
+    # Seconds between status checks while waiting for a message batch to finish
+    BATCH_POLL_INTERVAL = 5.0
+
+    # Default seconds to wait for a message batch before cancelling it
+    BATCH_MAX_WAIT = 3600.0
     
     def __init__(self, api_key: str, model: str):
+        # Clients live for the generator's lifetime; the SDK's default HTTP
+        # clients already pool connections and enable TCP keepalive
         self.client = anthropic.Anthropic(api_key=api_key)
         self.async_client = anthropic.AsyncAnthropic(api_key=api_key)
         self.model = model
@@ -92,9 +148,72 @@ Provide only the direct answer to what was asked.
             "max_tokens": 800
         }
 
-        # Enable iteration logging for debugging
-        self.enable_iteration_logging = True
+        # LRU cache of final responses, shared across request threads
+        self._response_cache: OrderedDict[bytes, str] = OrderedDict()
+        self._response_cache_lock = threading.Lock()
+
+        # Shared pool for running tool calls in parallel on the sync path
+        self._tool_executor = ThreadPoolExecutor(max_workers=self.TOOL_WORKERS)
+
+    async def aclose(self):
+        """Close pooled HTTP connections and the tool worker pool"""
+        self.client.close()
+        await self.async_client.close()
+        self._tool_executor.shutdown(wait=False)
     
+    def _build_system(self, conversation_history: Optional[str]) -> List[Dict[str, Any]]:
+        """Build system content blocks, appending conversation history only when present"""
+        if not conversation_history:
+            return self._SYSTEM_ONLY
+        return [
+            self._SYSTEM_BLOCK,
+            {"type": "text", "text": f"Previous conversation:\n{conversation_history}"}
+        ]
+
+    def _build_params(
+        self,
+        messages: List[Dict[str, Any]],
+        system: List[Dict[str, Any]],
+        tools: Optional[List] = None
+    ) -> Dict[str, Any]:
+        """Build API call parameters from a shallow copy of the base template"""
+        params = self.base_params.copy()
+        params["messages"] = messages
+        params["system"] = system
+        if tools:
+            params["tools"] = tools
+            params["tool_choice"] = self._TOOL_CHOICE_AUTO
+        return params
+
+    @staticmethod
+    def _extract_text(response) -> str:
+        """Join all text blocks of a response in a single pass"""
+        return "".join(block.text for block in response.content if hasattr(block, 'text'))
+
+    def _response_cache_key(self, query: str, conversation_history: Optional[str],
+                            tools: Optional[List]) -> bytes:
+        """Hash the inputs that determine a response into a compact cache key"""
+        tool_names = tuple(tool["name"] for tool in tools) if tools else ()
+        # repr of the tuple quotes each field, so distinct inputs cannot encode the same way
+        encoded = repr((query, conversation_history or "", tool_names)).encode()
+        return blake2b(encoded, digest_size=16).digest()
+
+    def _get_cached_response(self, key: bytes) -> Optional[str]:
+        """Return a cached response and mark it as most recently used"""
+        with self._response_cache_lock:
+            text = self._response_cache.get(key)
+            if text is not None:
+                self._response_cache.move_to_end(key)
+            return text
+
+    def _store_cached_response(self, key: bytes, text: str):
+        """Store a response, evicting the least recently used entry when full"""
+        with self._response_cache_lock:
+            self._response_cache[key] = text
+            self._response_cache.move_to_end(key)
+            if len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+
     def generate_response(self, query: str,
                          conversation_history: Optional[str] = None,
                          tools: Optional[List] = None,
@@ -111,35 +230,51 @@ Provide only the direct answer to what was asked.
         Returns:
             Generated response as string
         """
+        text, _ = self.generate_response_with_metadata(query, conversation_history, tools, tool_manager)
+        return text
+
+    def generate_response_with_metadata(self, query: str,
+                                        conversation_history: Optional[str] = None,
+                                        tools: Optional[List] = None,
+                                        tool_manager=None) -> Tuple[str, Dict[str, Any]]:
+        """
+        Generate AI response like generate_response, also reporting how it was produced.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+
+        Returns:
+            Tuple of (response text, metadata dict with "cache_hit")
+        """
+        # Serve identical requests from the cache without a network round-trip
+        cache_key = self._response_cache_key(query, conversation_history, tools)
+        cached = self._get_cached_response(cache_key)
+        if cached is not None:
+            return cached, {"cache_hit": True}
+
+        # Build system content blocks - static prompt is shared, history appended separately
+        system_content = self._build_system(conversation_history)
         
-        # Build system content efficiently - avoid string ops when possible
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history 
-            else self.SYSTEM_PROMPT
-        )
-        
-        # Prepare API call parameters efficiently
-        api_params = {
-            **self.base_params,
-            "messages": [{"role": "user", "content": query}],
-            "system": system_content
-        }
-        
-        # Add tools if available
-        if tools:
-            api_params["tools"] = tools
-            api_params["tool_choice"] = {"type": "auto"}
+        # Prepare API call parameters, adding tools if available
+        api_params = self._build_params([{"role": "user", "content": query}], system_content, tools)
         
         # Get response from Claude
         response = self.client.messages.create(**api_params)
         
-        # Handle tool execution if needed
+        # Handle tool execution if needed - not cached, since sources are
+        # collected as a side effect of running the tools
         if response.stop_reason == "tool_use" and tool_manager:
-            return self._handle_tool_execution(response, api_params, tool_manager)
+            return self._handle_tool_execution(response, api_params, tool_manager), {"cache_hit": False}
         
-        # Return direct response
-        return response.content[0].text
+        # Return direct response - only complete answers are cached, never
+        # truncated (max_tokens) or unexecuted tool_use responses
+        text = self._extract_text(response)
+        if response.stop_reason == "end_turn":
+            self._store_cached_response(cache_key, text)
+        return text, {"cache_hit": False}
     
     def _handle_tool_execution(self, initial_response, base_params: Dict[str, Any], tool_manager):
         """
@@ -153,157 +288,165 @@ Provide only the direct answer to what was asked.
         Returns:
             Final response text after tool execution
         """
-        # Start with existing messages
-        messages = base_params["messages"].copy()
+        # Extend the request's message list in place - it is built per call, so no copy is needed
+        messages = base_params["messages"]
         
         # Add AI's tool use response
         messages.append({"role": "assistant", "content": initial_response.content})
         
-        # Execute all tool calls and collect results
-        tool_results = []
-        for content_block in initial_response.content:
-            if content_block.type == "tool_use":
-                tool_result = tool_manager.execute_tool(
-                    content_block.name, 
-                    **content_block.input
-                )
-                
-                tool_results.append({
-                    "type": "tool_result",
-                    "tool_use_id": content_block.id,
-                    "content": tool_result
-                })
+        # Execute different tools concurrently; calls to the same tool run in request order
+        tool_blocks = [block for block in initial_response.content if block.type == "tool_use"]
+        groups = self._group_by_tool(tool_blocks)
+        results = self._results_by_id(
+            groups,
+            self._tool_executor.map(lambda group: self._run_tool_group(group, tool_manager), groups)
+        )
+        tool_results = [
+            {
+                "type": "tool_result",
+                "tool_use_id": block.id,
+                "content": results[block.id]
+            }
+            for block in tool_blocks
+        ]
         
         # Add tool results as single message
         if tool_results:
             messages.append({"role": "user", "content": tool_results})
         
         # Prepare final API call without tools
-        final_params = {
-            **self.base_params,
-            "messages": messages,
-            "system": base_params["system"]
-        }
+        final_params = self._build_params(messages, base_params["system"])
         
         # Get final response
         final_response = self.client.messages.create(**final_params)
-        return final_response.content[0].text
-
-    async def _execute_tool_async(self, tool_block, tool_manager):
-        """Execute a single tool asynchronously"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None,
-            tool_manager.execute_tool,
-            tool_block.name,
-            *(),
-            tool_block.input
-        )
+        return self._extract_text(final_response)
 
-    async def _handle_initial_state(self, context: ConversationContext, tools: Optional[List]) -> StateTransition:
-        """Handle the initial state - send first query to Claude"""
-        api_params = {
-            **self.base_params,
-            "messages": context.messages,
-            "system": context.system_prompt
-        }
+    def generate_responses_batch(self, queries: List[str],
+                                 max_wait: Optional[float] = None) -> List[Optional[str]]:
+        """
+        Generate responses for many independent queries via the Message Batches API.
+        Batches are billed at a discount but complete asynchronously, so this
+        blocks until the whole batch has ended. Tools are not offered, since
+        tool calls cannot be executed mid-batch.
 
-        if tools:
-            api_params["tools"] = tools
-            api_params["tool_choice"] = {"type": "auto"}
+        Args:
+            queries: The questions to answer
+            max_wait: Seconds to wait for the batch to end (default: BATCH_MAX_WAIT)
 
-        response = await self.async_client.messages.create(**api_params)
+        Returns:
+            Response text per query in input order, or None where a request failed
 
-        return StateTransition(
-            from_state=ConversationState.INITIAL,
-            to_state=ConversationState.AWAITING_TOOL_DECISION,
-            trigger="api_call_complete",
-            data={"response": response}
+        Raises:
+            TimeoutError: If the batch has not ended within max_wait; the batch is cancelled
+        """
+        if not queries:
+            return []
+
+        if max_wait is None:
+            max_wait = self.BATCH_MAX_WAIT
+
+        system_content = self._build_system(None)
+        batch = self.client.messages.batches.create(
+            requests=[
+                {
+                    "custom_id": str(i),
+                    "params": self._build_params([{"role": "user", "content": query}], system_content)
+                }
+                for i, query in enumerate(queries)
+            ]
         )
 
-    async def _handle_tool_decision_state(self, response, context: ConversationContext) -> StateTransition:
-        """Determine what to do based on stop_reason"""
-        stop_reason = response.stop_reason
-
-        if stop_reason == "tool_use":
-            # Claude wants to use tools
-            context.messages.append({
-                "role": "assistant",
-                "content": response.content
-            })
-
-            if self.enable_iteration_logging:
-                tool_names = [block.name for block in response.content if hasattr(block, 'type') and block.type == "tool_use"]
-                print(f"Tool iteration {context.tool_call_count + 1}: {tool_names}")
-
-            return StateTransition(
-                from_state=ConversationState.AWAITING_TOOL_DECISION,
-                to_state=ConversationState.EXECUTING_TOOLS,
-                trigger="tool_use",
-                data={"response": response, "tool_blocks": response.content}
-            )
-
-        elif stop_reason == "end_turn":
-            # Claude is providing final answer
-            final_text = None
-            for content_block in response.content:
-                if hasattr(content_block, 'text'):
-                    final_text = content_block.text
-                    break
-
-            return StateTransition(
-                from_state=ConversationState.AWAITING_TOOL_DECISION,
-                to_state=ConversationState.COMPLETED,
-                trigger="end_turn",
-                data={"final_text": final_text, "response": response}
-            )
+        # Wait for processing to end, cancelling the batch once the deadline passes
+        deadline = time.monotonic() + max_wait
+        while batch.processing_status != "ended":
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.client.messages.batches.cancel(batch.id)
+                raise TimeoutError(f"Message batch {batch.id} did not finish within {max_wait} seconds")
+            time.sleep(min(self.BATCH_POLL_INTERVAL, remaining))
+            batch = self.client.messages.batches.retrieve(batch.id)
+
+        # Results may arrive in any order - place them by custom_id
+        responses: List[Optional[str]] = [None] * len(queries)
+        for entry in self.client.messages.batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                responses[int(entry.custom_id)] = self._extract_text(entry.result.message)
+        return responses
+
+    @staticmethod
+    def _group_by_tool(tool_blocks) -> List[List[Any]]:
+        """Group tool_use blocks by tool name, keeping request order within each group"""
+        groups: Dict[str, List[Any]] = {}
+        for block in tool_blocks:
+            groups.setdefault(block.name, []).append(block)
+        return list(groups.values())
+
+    @staticmethod
+    def _run_tool_group(blocks, tool_manager) -> List[str]:
+        """
+        Run all calls to one tool sequentially. Tools are not safe to call
+        concurrently on the same instance - e.g. CourseSearchTool records
+        last_sources, which must come from the last requested search.
+        """
+        return [tool_manager.execute_tool(block.name, **block.input) for block in blocks]
+
+    @staticmethod
+    def _results_by_id(groups, group_results) -> Dict[str, str]:
+        """Map each tool_use id to its result"""
+        return {
+            block.id: result
+            for blocks, results in zip(groups, group_results)
+            for block, result in zip(blocks, results)
+        }
 
-        elif stop_reason == "max_tokens":
-            # Token limit reached
-            partial_text = None
-            for content_block in response.content:
-                if hasattr(content_block, 'text'):
-                    partial_text = content_block.text
-                    break
-
-            return StateTransition(
-                from_state=ConversationState.AWAITING_TOOL_DECISION,
-                to_state=ConversationState.ERROR,
-                trigger="max_tokens",
-                data={"error": "Token limit reached", "partial_text": partial_text}
-            )
+    async def _stream_message(
+        self,
+        api_params: Dict[str, Any],
+        state: ConversationState,
+        result: Dict[str, Any]
+    ) -> AsyncGenerator[StateTransition, None]:
+        """
+        Stream a message from Claude, yielding a token transition per text chunk.
+        The complete message is stored in result["response"] once the stream ends.
+        Tokens are yielded before the stop_reason is known; see generate_response_stream.
+        """
+        async with self.async_client.messages.stream(**api_params) as stream:
+            async for text in stream.text_stream:
+                yield StateTransition(
+                    from_state=state,
+                    to_state=state,
+                    trigger="token",
+                    data={"text": text}
+                )
+            result["response"] = await stream.get_final_message()
 
-        else:
-            # Unexpected stop reason
-            return StateTransition(
-                from_state=ConversationState.AWAITING_TOOL_DECISION,
-                to_state=ConversationState.ERROR,
-                trigger="unknown_stop_reason",
-                data={"error": f"Unexpected stop_reason: {stop_reason}"}
+    async def _handle_tool_execution_state(self, tool_blocks, context: ConversationContext, tool_manager) -> StateTransition:
+        """Execute pre-filtered tool_use blocks and prepare for next API call"""
+        # Execute different tools concurrently; calls to the same tool run in request order
+        groups = self._group_by_tool(tool_blocks)
+        results = self._results_by_id(
+            groups,
+            await asyncio.gather(
+                *(asyncio.to_thread(self._run_tool_group, group, tool_manager) for group in groups)
             )
+        )
 
-    async def _handle_tool_execution_state(self, tool_blocks, context: ConversationContext, tool_manager) -> StateTransition:
-        """Execute tools and prepare for next API call"""
         tool_results = []
-
         for content_block in tool_blocks:
-            if hasattr(content_block, 'type') and content_block.type == "tool_use":
-                # Execute tool
-                result = await self._execute_tool_async(content_block, tool_manager)
-
-                # Track in context
-                context.add_tool_call(
-                    tool_name=content_block.name,
-                    tool_input=content_block.input,
-                    result=result
-                )
+            result = results[content_block.id]
+            # Track in context
+            context.add_tool_call(
+                tool_name=content_block.name,
+                tool_input=content_block.input,
+                result=result
+            )
 
-                # Format result for API
-                tool_results.append({
-                    "type": "tool_result",
-                    "tool_use_id": content_block.id,
-                    "content": result
-                })
+            # Format result for API
+            tool_results.append({
+                "type": "tool_result",
+                "tool_use_id": content_block.id,
+                "content": result
+            })
 
         # Add tool results as user message
         if tool_results:
@@ -319,101 +462,70 @@ Provide only the direct answer to what was asked.
             data={"tool_results": tool_results}
         )
 
-    async def _handle_follow_up_state(self, context: ConversationContext, tools: Optional[List]) -> StateTransition:
-        """Send tool results back to Claude and get response"""
-        api_params = {
-            **self.base_params,
-            "messages": context.messages,
-            "system": context.system_prompt
-        }
-
-        if tools:
-            api_params["tools"] = tools
-            api_params["tool_choice"] = {"type": "auto"}
-
-        response = await self.async_client.messages.create(**api_params)
+    def _on_tool_use(self, response, context: ConversationContext, from_state: ConversationState) -> StateTransition:
+        """Claude wants to use tools"""
+        context.messages.append({
+            "role": "assistant",
+            "content": response.content
+        })
 
-        stop_reason = response.stop_reason
+        # Filter tool_use blocks once; execution reuses this list
+        tool_blocks = [block for block in response.content if getattr(block, 'type', None) == "tool_use"]
 
-        if stop_reason == "tool_use":
-            # Claude wants to use more tools
-            context.messages.append({
-                "role": "assistant",
-                "content": response.content
-            })
+        if logger.isEnabledFor(logging.DEBUG):
+            tool_names = [block.name for block in tool_blocks]
+            logger.debug("Tool iteration %d: %s", context.tool_call_count + 1, tool_names)
 
-            if self.enable_iteration_logging:
-                tool_names = [block.name for block in response.content if hasattr(block, 'type') and block.type == "tool_use"]
-                print(f"Tool iteration {context.tool_call_count + 1}: {tool_names}")
+        return StateTransition(
+            from_state=from_state,
+            to_state=ConversationState.EXECUTING_TOOLS,
+            trigger="tool_use",
+            data={"response": response, "tool_blocks": tool_blocks}
+        )
 
-            return StateTransition(
-                from_state=ConversationState.AWAITING_FOLLOW_UP,
-                to_state=ConversationState.EXECUTING_TOOLS,
-                trigger="tool_use",
-                data={"response": response, "tool_blocks": response.content}
-            )
+    def _on_end_turn(self, response, context: ConversationContext, from_state: ConversationState) -> StateTransition:
+        """Claude is done - extract final answer"""
+        return StateTransition(
+            from_state=from_state,
+            to_state=ConversationState.COMPLETED,
+            trigger="end_turn",
+            data={"final_text": self._extract_text(response), "response": response}
+        )
 
-        elif stop_reason == "end_turn":
-            # Claude is done - extract final answer
-            final_text = None
-            for content_block in response.content:
-                if hasattr(content_block, 'text'):
-                    final_text = content_block.text
-                    break
-
-            return StateTransition(
-                from_state=ConversationState.AWAITING_FOLLOW_UP,
-                to_state=ConversationState.COMPLETED,
-                trigger="end_turn",
-                data={"final_text": final_text, "response": response}
-            )
+    def _on_max_tokens(self, response, context: ConversationContext, from_state: ConversationState) -> StateTransition:
+        """Token limit reached - surface partial text as an error"""
+        return StateTransition(
+            from_state=from_state,
+            to_state=ConversationState.ERROR,
+            trigger="max_tokens",
+            data={"error": "Token limit reached", "partial_text": self._extract_text(response)}
+        )
 
-        elif stop_reason == "max_tokens":
-            partial_text = None
-            for content_block in response.content:
-                if hasattr(content_block, 'text'):
-                    partial_text = content_block.text
-                    break
-
-            return StateTransition(
-                from_state=ConversationState.AWAITING_FOLLOW_UP,
-                to_state=ConversationState.ERROR,
-                trigger="max_tokens",
-                data={"error": "Token limit reached", "partial_text": partial_text}
-            )
+    def _on_unknown_stop(self, response, context: ConversationContext, from_state: ConversationState) -> StateTransition:
+        """Unexpected stop reason"""
+        return StateTransition(
+            from_state=from_state,
+            to_state=ConversationState.ERROR,
+            trigger="unknown_stop_reason",
+            data={"error": f"Unexpected stop_reason: {response.stop_reason}"}
+        )
 
-        else:
-            return StateTransition(
-                from_state=ConversationState.AWAITING_FOLLOW_UP,
-                to_state=ConversationState.ERROR,
-                trigger="unknown_stop_reason",
-                data={"error": f"Unexpected stop_reason: {stop_reason}"}
-            )
+    # Dispatch table from stop_reason to the handler building its transition
+    _STOP_HANDLERS = {
+        "tool_use": _on_tool_use,
+        "end_turn": _on_end_turn,
+        "max_tokens": _on_max_tokens,
+    }
 
-    async def _dispatch_state(
+    def _classify_response(
         self,
-        state: ConversationState,
+        response,
         context: ConversationContext,
-        tools: Optional[List],
-        tool_manager,
-        last_response=None
+        from_state: ConversationState
     ) -> StateTransition:
-        """Dispatch to the appropriate state handler"""
-        if state == ConversationState.INITIAL:
-            return await self._handle_initial_state(context, tools)
-
-        elif state == ConversationState.AWAITING_TOOL_DECISION:
-            return await self._handle_tool_decision_state(last_response, context)
-
-        elif state == ConversationState.EXECUTING_TOOLS:
-            tool_blocks = last_response.content if last_response else []
-            return await self._handle_tool_execution_state(tool_blocks, context, tool_manager)
-
-        elif state == ConversationState.AWAITING_FOLLOW_UP:
-            return await self._handle_follow_up_state(context, tools)
-
-        else:
-            raise ValueError(f"No handler for state: {state}")
+        """Build the transition for a Claude response based on its stop_reason"""
+        handler = self._STOP_HANDLERS.get(response.stop_reason, AIGenerator._on_unknown_stop)
+        return handler(self, response, context, from_state)
 
     async def generate_response_stream(
         self,
@@ -424,25 +536,28 @@ Provide only the direct answer to what was asked.
         max_iterations: int = 10
     ) -> AsyncGenerator[StateTransition, None]:
         """
-        Generate AI response with sequential tool calling via state machine.
-        Yields state transitions as they occur.
+        Generate AI response with sequential tool calling.
+        Runs a flat API/tool loop and yields state transitions as an event log,
+        including "token" transitions carrying streamed text chunks in data["text"].
+
+        Tokens are streamed for every API call, so a turn that ends in tool use
+        may first stream preamble text (e.g. "Let me search..."). That text is
+        superseded: consumers must discard tokens received so far when a
+        "tool_use" transition arrives. The COMPLETED transition's final_text
+        holds only the last turn's text, matching the tokens since that reset.
 
         Args:
             query: The user's question or request
             conversation_history: Previous messages for context
             tools: Available tools the AI can use
             tool_manager: Manager to execute tools
-            max_iterations: Maximum tool-use cycles (default: 10)
+            max_iterations: Maximum API calls, one per tool-use cycle plus the final answer (default: 10)
 
         Yields:
             StateTransition objects as the conversation progresses
         """
-        # Build system content
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history
-            else self.SYSTEM_PROMPT
-        )
+        # Build system content blocks
+        system_content = self._build_system(conversation_history)
 
         # Initialize context
         context = ConversationContext(
@@ -450,40 +565,40 @@ Provide only the direct answer to what was asked.
             system_prompt=system_content
         )
 
-        # State machine loop
-        current_state = ConversationState.INITIAL
-        iteration = 0
-        last_response = None
-
-        while current_state not in [ConversationState.COMPLETED, ConversationState.ERROR] and iteration < max_iterations:
-            iteration += 1
-
-            # Dispatch to appropriate state handler
-            transition = await self._dispatch_state(
-                current_state,
-                context,
-                tools,
-                tool_manager,
-                last_response
-            )
+        # Parameters are built once; the shared message list grows in place
+        api_params = self._build_params(context.messages, system_content, tools)
+        state = ConversationState.INITIAL
+
+        for _ in range(max_iterations):
+            # Stream the next response, forwarding tokens as they arrive
+            result = {}
+            async for token in self._stream_message(api_params, state, result):
+                yield token
+            response = result["response"]
+
+            if state == ConversationState.INITIAL:
+                state = ConversationState.AWAITING_TOOL_DECISION
+                yield StateTransition(
+                    from_state=ConversationState.INITIAL,
+                    to_state=state,
+                    trigger="api_call_complete",
+                    data={"response": response}
+                )
 
-            # Yield the transition for streaming/logging
+            transition = self._classify_response(response, context, state)
             yield transition
 
-            # Check for terminal states
-            if transition.to_state in [ConversationState.COMPLETED, ConversationState.ERROR]:
-                break
+            # Anything other than a tool request ends the conversation
+            if transition.to_state != ConversationState.EXECUTING_TOOLS:
+                return
 
-            # Update state and response
-            current_state = transition.to_state
-            if "response" in transition.data:
-                last_response = transition.data["response"]
+            yield await self._handle_tool_execution_state(transition.data["tool_blocks"], context, tool_manager)
+            state = ConversationState.AWAITING_FOLLOW_UP
 
         # Safety: Max iterations exceeded
-        if iteration >= max_iterations and current_state not in [ConversationState.COMPLETED, ConversationState.ERROR]:
-            yield StateTransition(
-                from_state=current_state,
-                to_state=ConversationState.ERROR,
-                trigger="max_iterations_exceeded",
-                data={"error": f"Exceeded {max_iterations} iterations without completion"}
-            )
\ No newline at end of file
+        yield StateTransition(
+            from_state=state,
+            to_state=ConversationState.ERROR,
+            trigger="max_iterations_exceeded",
+            data={"error": f"Exceeded {max_iterations} iterations without completion"}
+        )
\ No newline at end of file
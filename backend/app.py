@@ -100,6 +100,11 @@ async def query_documents_stream(request: QueryRequest):
                         event_data["response"] = event.get("response")
                         event_data["sources"] = event.get("sources", [])
 
+                    # Add streamed text chunk for token events - clients reset
+                    # accumulated text on a "tool_use" trigger
+                    if event.get("trigger") == "token":
+                        event_data["text"] = event.get("text")
+
                     # Add error info if present
                     if event.get("error"):
                         event_data["error"] = event.get("error")
@@ -149,6 +154,11 @@ async def startup_event():
         except Exception as e:
             print(f"Error loading documents: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled API connections on shutdown"""
+    await rag_system.ai_generator.aclose()
+
 # Custom static file handler with no-cache headers for development
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
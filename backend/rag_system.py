@@ -150,7 +150,10 @@ class RAGSystem:
             session_id: Optional session ID for conversation context
 
         Yields:
-            Dict objects containing state transition information
+            Dict objects containing state transition information. "token" events
+            carry streamed text; clients should clear accumulated text on a
+            "tool_use" event, since the final response (and session history)
+            excludes any preamble streamed before a tool call.
         """
         # Create prompt for the AI with clear instructions
         prompt = f"""Answer this question about course materials: {query}"""
@@ -169,6 +172,17 @@ class RAGSystem:
             tools=self.tool_manager.get_tool_definitions(),
             tool_manager=self.tool_manager
         ):
+            # Forward streamed text chunks without treating them as state changes
+            if transition.trigger == "token":
+                yield {
+                    "state": transition.to_state.name,
+                    "trigger": "token",
+                    "from_state": transition.from_state.name,
+                    "text": transition.data["text"],
+                    "data": {}
+                }
+                continue
+
             # Yield transition info for real-time UI updates
             yield {
                 "state": transition.to_state.name,
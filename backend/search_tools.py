@@ -201,6 +201,7 @@ class ToolManager:
     
     def __init__(self):
         self.tools = {}
+        self._tool_definitions = None  # Cached definitions, rebuilt when tools change
     
     def register_tool(self, tool: Tool):
         """Register any tool that implements the Tool interface"""
@@ -209,11 +210,18 @@ class ToolManager:
         if not tool_name:
             raise ValueError("Tool must have a 'name' in its definition")
         self.tools[tool_name] = tool
+        self._tool_definitions = None
 
     
     def get_tool_definitions(self) -> list:
-        """Get all tool definitions for Anthropic tool calling"""
-        return [tool.get_tool_definition() for tool in self.tools.values()]
+        """Get all tool definitions for Anthropic tool calling, built once per tool set"""
+        if self._tool_definitions is None:
+            definitions = [tool.get_tool_definition() for tool in self.tools.values()]
+            if definitions:
+                # Mark the end of the tool list so Anthropic caches the definitions as a prompt prefix
+                definitions[-1] = {**definitions[-1], "cache_control": {"type": "ephemeral"}}
+            self._tool_definitions = definitions
+        return self._tool_definitions
     
     def execute_tool(self, tool_name: str, **kwargs) -> str:
         """Execute a tool by name with given parameters"""